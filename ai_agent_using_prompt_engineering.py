@@ -1,45 +1,123 @@
+import inspect
 import json
 import os
-from typing import List, Dict, Callable, Any, Optional
+import time
+from functools import lru_cache
+from typing import List, Dict, Callable, Any, Generator, Optional, Tuple
 
-from llm_client import LLMClient
+from json_repair import repair_json
 
+from llm_client import ChatHistory, LLMClient
 
-def extract_markdown_block(response: str, block_type: str = "json") -> str:
-    """Extracts a markdown code block with a specific block type (e.g., json, action)."""
-    if "```" not in response:
-        return response
 
-    parts = response.split("```")
-    for i in range(1, len(parts), 2):  # Odd indices should contain code blocks
-        block = parts[i].strip()
-        if block.startswith(block_type):
-            return block[len(block_type):].strip()
-    return response.strip()
+# Compact encoding for results that go back into the prompt, whitespace only costs tokens there
+_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+_ACTION_TAG = "action"
+_FENCE = "```"
+
+
+def _load_action_json(block: str) -> Any:
+    """Parses the action block, repairing truncated or sloppy JSON if the fast path fails."""
+    try:
+        return json.loads(block)
+    except json.JSONDecodeError:
+        repaired = repair_json(block, return_objects=True)
+        if not isinstance(repaired, dict):
+            raise
+        return repaired
+
+
+# Shared, read-only results for the error paths of parse_action
+_MALFORMED = {"tool_name": "error", "args": {"message": "Malformed JSON in action block."}}
+_MISSING_FIELDS = {"tool_name": "error", "args": {"message": "Missing required fields in action JSON."}}
+
+
+def _scan_action_block(text: str, pos: int = 0) -> Tuple[int, int, int]:
+    """Finds the first action block at or after pos, pairing opening and closing fences.
+
+    Returns (start, end, resume): start is the index of the block body or -1, end the index
+    of its closing fence or -1 while unclosed, and resume the position from which a scan of
+    the same text with more appended must restart.
+    """
+    search_from = pos
+    fence = text.find(_FENCE, search_from)
+    while fence != -1:
+        # Allow spaces between the fence and the tag, e.g. "``` action"
+        tag = fence + len(_FENCE)
+        while tag < len(text) and text[tag] in " \t":
+            tag += 1
+        if text.startswith(_ACTION_TAG, tag):
+            start = tag + len(_ACTION_TAG)
+            return start, text.find(_FENCE, start), fence
+        close = text.find(_FENCE, tag)
+        if close == -1:
+            # Unclosed, and the tag may still be arriving
+            return -1, -1, fence
+        search_from = close + len(_FENCE)
+        fence = text.find(_FENCE, search_from)
+    # Keep enough of the tail to catch a fence split across chunks
+    return -1, -1, max(search_from, len(text) - len(_FENCE) + 1)
+
+
+def _find_action_block(response: str) -> Optional[str]:
+    """Returns the body of the first action block, running to the end of the text if it is unclosed."""
+    start, end, _ = _scan_action_block(response)
+    if start == -1:
+        return None
+    return response[start:] if end == -1 else response[start:end]
 
 
 def parse_action(response: str) -> Dict:
     """Parse the LLM response into a structured action dictionary."""
+    block = _find_action_block(response)
     try:
-        response = extract_markdown_block(response, "action")
-        response_json = json.loads(response)
-        if "tool_name" in response_json and "args" in response_json:
-            return response_json
-        return {"tool_name": "error", "args": {"message": "Missing required fields in action JSON."}}
+        response_json = _load_action_json(response if block is None else block)
     except json.JSONDecodeError:
-        return {"tool_name": "error", "args": {"message": "Malformed JSON in action block."}}
+        return _MALFORMED
+    if isinstance(response_json, dict) and "tool_name" in response_json and "args" in response_json:
+        return response_json
+    return _MISSING_FIELDS
+
+
+@lru_cache(maxsize=32)
+def _read_file_cached(path: str, mtime_ns: int, size: int, max_bytes: int) -> str:
+    """Reads at most max_bytes of a file. mtime_ns and size are part of the cache key only."""
+    with open(path, "rb") as f:
+        data = f.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return data[:max_bytes].decode("utf-8", errors="replace") + f"\n…[truncated at {max_bytes} bytes]"
+    return data.decode("utf-8", errors="replace")
 
 
 class ToolExecutor:
     """Executes available tools like reading and listing files."""
 
+    def __init__(self, listdir_ttl: float = 1.0, max_read_bytes: int = 256_000):
+        self.listdir_ttl = listdir_ttl
+        # Kept off read_file's signature so the model can't lift the cap through the action args
+        self.max_read_bytes = max_read_bytes
+        self._listdir_cache: Dict[str, Tuple[float, List[str]]] = {}
+
+    def clear_cache(self) -> None:
+        self._listdir_cache.clear()
+
     def list_files(self) -> List[str]:
-        return os.listdir(".")
+        now = time.monotonic()
+        cwd = os.getcwd()
+        hit = self._listdir_cache.get(cwd)
+        if hit and now - hit[0] < self.listdir_ttl:
+            return hit[1]
+        files = os.listdir(".")
+        self._listdir_cache[cwd] = (now, files)
+        return files
 
     def read_file(self, file_name: str) -> str:
         try:
-            with open(file_name, "r") as f:
-                return f.read()
+            path = os.path.abspath(file_name)
+            stat = os.stat(path)
+            return _read_file_cached(path, stat.st_mtime_ns, stat.st_size, self.max_read_bytes)
         except FileNotFoundError:
             return f"Error: File '{file_name}' not found."
         except Exception as e:
@@ -47,17 +125,26 @@ class ToolExecutor:
 
 
 class Agent:
-    def __init__(self, llm_client: LLMClient, tools: ToolExecutor, max_iterations: int = 10):
+    def __init__(self, llm_client: LLMClient, tools: ToolExecutor, max_iterations: int = 10,
+                 max_listed_files: int = 200, max_response_tokens: int = 512, verbose: bool = True):
         self.llm = llm_client
         self.tools = tools
         self.max_iterations = max_iterations
-        self.memory: List[Dict[str, str]] = []
-        self.agent_rules = self._load_rules()
-        self.tool_map: Dict[str, Callable[[Dict[str, Any]], Any]] = {
-            "list_files": lambda _: {"result": self.tools.list_files()},
-            "read_file": lambda args: {"result": self.tools.read_file(args["file_name"])},
-            "terminate": lambda args: {"terminate": args["message"]},
-            "error": lambda args: {"error": args["message"]},
+        self.max_listed_files = max_listed_files
+        # A thought plus the action JSON rarely needs more, and a small cap keeps the server budget low
+        self.max_response_tokens = max_response_tokens
+        self.verbose = verbose
+        self.memory = ChatHistory()
+        # Built once and never mutated so the system prompt stays byte-identical across
+        # iterations and the provider can reuse its cached prefix.
+        self.agent_rules = tuple(self._load_rules())
+        self.tool_map: Dict[str, Callable[..., Any]] = {
+            "list_files": self.tools.list_files,
+            "read_file": self.tools.read_file,
+        }
+        # Parameters each tool accepts; anything else the model adds to args is dropped
+        self.tool_params: Dict[str, frozenset] = {
+            name: frozenset(inspect.signature(fn).parameters) for name, fn in self.tool_map.items()
         }
 
     def _load_rules(self) -> List[Dict[str, str]]:
@@ -110,37 +197,90 @@ class Agent:
                         """
         }]
 
-    def run(self, user_task: str):
-        self.memory = [{"role": "user", "content": user_task}]
-        for i in range(self.max_iterations):
-            print(f"\n🧠 Iteration {i+1}")
-            prompt = self.agent_rules + self.memory
+    def _next_prompt(self, iteration: int) -> List[Dict[str, str]]:
+        if self.verbose:
+            print(f"\n🧠 Iteration {iteration+1}")
             print("🧠 Agent thinking...")
-            response = self.llm.generate_response(prompt)
-            print(f"🤖 Agent response:\n{response}\n")
+        return list(self.agent_rules) + self.memory.as_messages()
 
-            action = parse_action(response)
-            tool_name = action.get("tool_name")
-            args = action.get("args", {})
+    def _execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        tool_fn = self.tool_map.get(tool_name)
+        if tool_fn is None:
+            return {"error": f"Unknown action: {tool_name}"}
+        params = self.tool_params[tool_name]
+        try:
+            result = tool_fn(**{k: v for k, v in args.items() if k in params})
+        except TypeError as e:
+            return {"error": f"Invalid arguments for {tool_name}: {e}"}
+        if tool_name == "list_files" and len(result) > self.max_listed_files:
+            # Keep huge directories from blowing up the prompt on every following iteration
+            return {"result": result[:self.max_listed_files], "truncated": len(result) - self.max_listed_files}
+        return {"result": result}
 
-            tool_fn = self.tool_map.get(tool_name, lambda _: {"error": f"Unknown action: {tool_name}"})
-            result = tool_fn(args)
+    def _read_until_action(self, chunks: Generator[str, None, None]) -> str:
+        """Collects a streamed response and stops the generation once the first action block is closed."""
+        text = ""
+        resume = 0
+        try:
+            for chunk in chunks:
+                text += chunk
+                # Same fence pairing as parse_action, restarting from the first undecided fence
+                start, end, resume = _scan_action_block(text, resume)
+                if end != -1:
+                    return text[:end + len(_FENCE)]
+        finally:
+            chunks.close()
+        return text
 
-            # Termination check
-            if "terminate" in result:
-                print(f"\n✅ Termination: {result['terminate']}")
-                break
+    def _handle_response(self, response: str) -> bool:
+        """Executes the action in the response and records it. Returns True when the agent terminates."""
+        if self.verbose:
+            print(f"🤖 Agent response:\n{response}\n")
 
-            # Log result
-            print(f"🛠️ Action result: {json.dumps(result, indent=2)}")
+        action = parse_action(response)
+        tool_name = action.get("tool_name")
+        args = action.get("args", {})
 
-            # Update memory
-            self.memory.extend([
-                {"role": "assistant", "content": response},
-                {"role": "user", "content": json.dumps(result)}
-            ])
+        # terminate and error don't touch the tools, handle them before dispatching
+        if tool_name == "terminate":
+            print(f"\n✅ Termination: {args.get('message', '')}")
+            return True
+        if tool_name == "error":
+            result = {"error": args.get("message", "")}
         else:
-            print("\n⚠️ Max iterations reached. Exiting.")
+            result = self._execute_tool(tool_name, args)
+
+        # Log result
+        if self.verbose:
+            print(f"🛠️ Action result: {json.dumps(result, indent=2)}")
+
+        # Update memory
+        self.memory.append("assistant", response)
+        self.memory.append("user", _dumps(result))
+        return False
+
+    def run(self, user_task: str):
+        self.tools.clear_cache()
+        self.memory = ChatHistory()
+        self.memory.append("user", user_task)
+        for i in range(self.max_iterations):
+            prompt = self._next_prompt(i)
+            stream = self.llm.stream_response(prompt, max_tokens=self.max_response_tokens)
+            if self._handle_response(self._read_until_action(stream)):
+                return
+        print("\n⚠️ Max iterations reached. Exiting.")
+
+    async def arun(self, user_task: str):
+        """Same loop as run, but awaits the LLM so several agents can share one event loop."""
+        self.tools.clear_cache()
+        self.memory = ChatHistory()
+        self.memory.append("user", user_task)
+        for i in range(self.max_iterations):
+            prompt = self._next_prompt(i)
+            response = await self.llm.agenerate_response(prompt, max_tokens=self.max_response_tokens)
+            if self._handle_response(response):
+                return
+        print("\n⚠️ Max iterations reached. Exiting.")
 
 if __name__ == "__main__":
     user_task = input("What would you like me to do? ")
@@ -1,7 +1,12 @@
-import time
+import datetime
 import traceback
+import types
+from collections import deque
 from dataclasses import dataclass
-from typing import Callable, Dict, Any, List
+from itertools import islice
+from typing import Callable, Dict, Any, List, Iterator, Optional, ValuesView
+
+_UTC = datetime.timezone.utc
 
 
 @dataclass(frozen=True)
@@ -12,6 +17,8 @@ class Goal:
 
 
 class Action:
+    __slots__ = ("name", "function", "description", "terminal", "parameters")
+
     def __init__(self,
                  name: str,
                  function: Callable,
@@ -30,46 +37,70 @@ class Action:
 
 
 class ActionRegistry:
+    __slots__ = ("actions",)
+
     def __init__(self):
         self.actions = {}
 
     def register(self, action: Action):
         self.actions[action.name] = action
 
-    def get_action(self, name: str) -> [Action, None]:
-        return self.actions.get(name, None)
+    def freeze(self):
+        """Make the registry read-only once all actions are registered"""
+        self.actions = types.MappingProxyType(dict(self.actions))
 
-    def get_actions(self) -> List[Action]:
-        """Get all registered actions"""
-        return list(self.actions.values())
+    def get_action(self, name: str) -> Optional[Action]:
+        return self.actions.get(name)
+
+    def get_actions(self) -> ValuesView[Action]:
+        """Get a view of all registered actions"""
+        return self.actions.values()
 
 
 class Memory:
-    def __init__(self):
-        self.items = []
+    __slots__ = ("items",)
+
+    def __init__(self, maxlen: Optional[int] = None):
+        # With maxlen set, the oldest memories are dropped once the limit is reached
+        self.items = deque(maxlen=maxlen)
 
     def add_memory(self, memory: dict):
         self.items.append(memory)
 
-    def get_memories(self, limit: int = None) -> List[Dict]:
-        return self.items[:limit]
+    def iter_memories(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Iterate over the memories without copying them, limit follows slice semantics"""
+        if limit is not None and limit < 0:
+            limit = max(len(self.items) + limit, 0)
+        return islice(self.items, limit)
+
+    def get_memories(self, limit: Optional[int] = None) -> List[Dict]:
+        return list(self.iter_memories(limit))
 
 
 class Environment:
+    __slots__ = ("verbose_traceback",)
+
+    def __init__(self, verbose_traceback: bool = False):
+        self.verbose_traceback = verbose_traceback
+
     def execute_action(self, action: Action, args: dict) -> dict:
         try:
             result = action.execute(**args)
             return self.format_result(result)
         except Exception as e:
-            return {
+            error = {
                 "tool_executed": False,
+                "error_type": type(e).__name__,
                 "error": str(e),
-                "traceback": traceback.format_exc()
             }
+            if self.verbose_traceback:
+                tb = traceback.TracebackException.from_exception(e, limit=-5)
+                error["traceback"] = "".join(tb.format())
+            return error
 
     def format_result(self, result: Any) -> dict:
         return {
             "tool_executed": True,
             "result": result,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%Z")
+            "timestamp": datetime.datetime.now(_UTC).isoformat(timespec="seconds")
         }
\ No newline at end of file
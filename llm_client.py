@@ -1,6 +1,122 @@
-from typing import Optional, List, Dict
+import hashlib
+import json
+import math
+from collections import OrderedDict, deque
+from typing import Optional, List, Dict, Generator, Tuple
 
-from litellm import completion
+from litellm import acompletion, completion, embedding
+
+
+def _digest(value) -> str:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+class ChatHistory:
+    """Conversation turns kept as parallel role/content lists.
+
+    The message dicts litellm expects are only built by as_messages, once per request,
+    instead of keeping one dict alive per turn.
+    """
+    __slots__ = ("roles", "contents")
+
+    def __init__(self):
+        self.roles: List[str] = []
+        self.contents: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.roles)
+
+    def append(self, role: str, content: str) -> None:
+        self.roles.append(role)
+        self.contents.append(content)
+
+    def as_messages(self) -> List[Dict[str, str]]:
+        return [{"role": r, "content": c} for r, c in zip(self.roles, self.contents)]
+
+    def trim(self, max_tokens: int) -> None:
+        """Drop the oldest turns until the history fits in max_tokens, always keeping the last turn.
+
+        Tokens are estimated as len(content) // 4 to avoid running a tokenizer.
+        """
+        total = sum(len(c) // 4 for c in self.contents)
+        drop = 0
+        while total > max_tokens and drop < len(self.contents) - 1:
+            total -= len(self.contents[drop]) // 4
+            drop += 1
+        del self.roles[:drop]
+        del self.contents[:drop]
+
+
+class SemanticCache:
+    """Caches LLM responses by exact message list and, optionally, by embedding similarity.
+
+    Exact hits are a dict lookup on a hash of the messages. When an embedding model is
+    configured, the last message is embedded and compared against earlier calls that
+    share the same preceding context, so near-duplicate questions reuse the answer.
+
+    Only complete responses are stored. Streams closed early, like the agent loop's
+    streamed actions, are not cached, so the cache mainly serves generate_response
+    and agenerate_response. Both stores keep at most max_entries items, evicting the
+    least recently used exact entry and the oldest semantic one.
+    """
+
+    def __init__(
+            self,
+            threshold: float = 0.95,
+            embedding_model: Optional[str] = None,
+            api_base: Optional[str] = None,
+            max_entries: int = 1024,
+    ):
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self.api_base = api_base
+        self.max_entries = max_entries
+        self.exact_cache: "OrderedDict[str, str]" = OrderedDict()
+        # (context, unit vector, response)
+        self._entries: "deque[Tuple[str, List[float], str]]" = deque(maxlen=max_entries)
+
+    def _embed(self, text: str) -> List[float]:
+        response = embedding(model=self.embedding_model, input=[text], api_base=self.api_base)
+        vector = response.data[0]["embedding"]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def get(self, messages: List[Dict], model: str,
+            max_tokens: Optional[int]) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Returns the cached response, or None and the embedding to hand back to put on a miss.
+
+        The embedding is returned rather than kept here so a call that never completes
+        (an error, or a stream closed early) leaves nothing behind in the cache.
+        """
+        key = _digest([model, max_tokens, messages])
+        if key in self.exact_cache:
+            self.exact_cache.move_to_end(key)
+            return self.exact_cache[key], None
+        if not self.embedding_model or not messages:
+            return None, None
+
+        # Only compare against calls made with the same model and history, so an answer never
+        # leaks into a conversation with a different system prompt or earlier turns.
+        context = _digest([model, max_tokens, messages[:-1]])
+        vector = self._embed(str(messages[-1]["content"]))
+        best_score, best_response = self.threshold, None
+        for entry_context, entry_vector, response in self._entries:
+            if entry_context != context:
+                continue
+            score = sum(a * b for a, b in zip(vector, entry_vector))
+            if score >= best_score:
+                best_score, best_response = score, response
+        return best_response, vector if best_response is None else None
+
+    def put(self, messages: List[Dict], model: str, max_tokens: Optional[int], response: str,
+            vector: Optional[List[float]] = None) -> None:
+        key = _digest([model, max_tokens, messages])
+        self.exact_cache[key] = response
+        self.exact_cache.move_to_end(key)
+        if len(self.exact_cache) > self.max_entries:
+            self.exact_cache.popitem(last=False)
+        if vector is not None:
+            self._entries.append((_digest([model, max_tokens, messages[:-1]]), vector, response))
 
 
 class LLMClient:
@@ -9,16 +125,91 @@ class LLMClient:
             model: str = "ollama/llama3.2:latest",
             api_base: str = "http://localhost:11434",
             max_tokens: Optional[int] = None,
+            cache: Optional[SemanticCache] = None,
     ):
         self.model = model
         self.api_base = api_base
         self.max_tokens = max_tokens
+        self.cache = cache
+
+    def _prepare_messages(self, messages: List[Dict]) -> List[Dict]:
+        """Mark static system messages as cacheable for providers that need it explicitly.
 
-    def generate_response(self, messages: List[Dict]) -> str:
-        response = completion(
+        OpenAI and Gemini cache identical prefixes automatically, Anthropic needs a
+        cache_control marker on the content block.
+        """
+        if not self.model.startswith("anthropic/"):
+            return messages
+        return [
+            {
+                "role": "system",
+                "content": [{"type": "text", "text": m["content"], "cache_control": {"type": "ephemeral"}}],
+            } if m["role"] == "system" and isinstance(m["content"], str) else m
+            for m in messages
+        ]
+
+    def _request_kwargs(self, messages: List[Dict], max_tokens: Optional[int]) -> Dict:
+        return dict(
             model=self.model,
-            messages=messages,
+            messages=self._prepare_messages(messages),
             api_base=self.api_base,
-            max_tokens=self.max_tokens,
+            max_tokens=max_tokens,
         )
-        return response.choices[0].message.content
+
+    def _cached(self, messages: List[Dict],
+                max_tokens: Optional[int]) -> Tuple[Optional[str], Optional[List[float]]]:
+        if self.cache is None:
+            return None, None
+        return self.cache.get(messages, self.model, max_tokens)
+
+    def _store(self, messages: List[Dict], max_tokens: Optional[int], content: str,
+               vector: Optional[List[float]]) -> str:
+        if self.cache is not None:
+            self.cache.put(messages, self.model, max_tokens, content, vector)
+        return content
+
+    def generate_response(self, messages: List[Dict], *, max_tokens: Optional[int] = None) -> str:
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        cached, vector = self._cached(messages, max_tokens)
+        if cached is not None:
+            return cached
+        response = completion(**self._request_kwargs(messages, max_tokens))
+        return self._store(messages, max_tokens, response.choices[0].message.content, vector)
+
+    async def agenerate_response(self, messages: List[Dict], *, max_tokens: Optional[int] = None) -> str:
+        """Async variant of generate_response so independent calls can run concurrently."""
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        cached, vector = self._cached(messages, max_tokens)
+        if cached is not None:
+            return cached
+        response = await acompletion(**self._request_kwargs(messages, max_tokens))
+        return self._store(messages, max_tokens, response.choices[0].message.content, vector)
+
+    def stream_response(self, messages: List[Dict], *, max_tokens: Optional[int] = None) -> Generator[str, None, None]:
+        """Yields the response text as it is generated.
+
+        Closing the generator early aborts the underlying request, so callers can stop
+        the generation once they have what they need. Only complete responses are cached.
+        """
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        cached, vector = self._cached(messages, max_tokens)
+        if cached is not None:
+            yield cached
+            return
+
+        response = completion(**self._request_kwargs(messages, max_tokens), stream=True)
+        parts = []
+        try:
+            for chunk in response:
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    yield content
+        finally:
+            # litellm's stream wrapper has no sync close(), so close the provider stream it
+            # wraps; that releases the HTTP response and the server stops generating.
+            stream = getattr(response, "completion_stream", None)
+            close = getattr(stream, "close", None) or getattr(response, "close", None)
+            if close is not None:
+                close()
+        self._store(messages, max_tokens, "".join(parts), vector)
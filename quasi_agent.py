@@ -1,3 +1,6 @@
+import asyncio
+import re
+
 from dotenv import load_dotenv
 from typing import List, Dict
 
@@ -5,23 +8,32 @@ from llm_client import LLMClient
 
 load_dotenv()
 
+# Captures the language tag and body of each fenced block. A word counts as the tag only when a
+# line break follows it, and an unclosed fence runs to the end of the text.
+_BLOCK_RE = re.compile(r"```(?:(\w+)[ \t]*\r?\n)?(.*?)(?:```|\Z)", re.DOTALL)
+# Everything that is neither alphanumeric nor whitespace
+_FILENAME_DROP_RE = re.compile(r"[^\w\s]|_")
+
 
 class QuasiAgent:
-    def __init__(self, llm_client: LLMClient):
+    def __init__(self, llm_client: LLMClient, max_tokens: int = 1024):
         self.llm_client = llm_client
+        self.max_tokens = max_tokens
 
-    def _extract_code_block(self, response: str) -> str:
-        """Extract code block from response"""
-        if "```" not in response:
-            return response
-        code_block = response.split("```")[1].strip()
-        return code_block[6:] if code_block.startswith("python") else code_block
+    def _extract_code_block(self, response: str, block_type: str = "python") -> str:
+        """Extract code block from response, preferring blocks of the given type"""
+        first = None
+        for match in _BLOCK_RE.finditer(response):
+            if match.group(1) == block_type:
+                return match.group(2).strip()
+            first = first or match
+        return first.group(2).strip() if first else response
 
     def _add_message(self, messages: List[Dict], role: str, content: str) -> None:
         messages.append({"role": role, "content": content})
 
     def _build_filename(self, description: str) -> str:
-        filename = ''.join(c for c in description.lower() if c.isalnum() or c.isspace())
+        filename = _FILENAME_DROP_RE.sub("", description.lower())
         return filename.replace(" ", "_")[:30] + ".py"
 
     def _interactive_input(self) -> str:
@@ -29,7 +41,7 @@ class QuasiAgent:
         print("Example: 'A function that calculates the factorial of a number'")
         return input("Your description: ").strip()
 
-    def develop_custom_function(self):
+    async def develop_custom_function(self):
         function_description = self._interactive_input()
 
         messages = [{"role": "system", "content": "You are a Python expert helping to develop a function"}]
@@ -37,27 +49,32 @@ class QuasiAgent:
         # Step 1 - Generate base function
         self._add_message(messages, "user", f"Write a Python function that {function_description}. "
                                             f"Output the function in a ```python code block```.")
-        base_function = self._extract_code_block(self.llm_client.generate_response(messages))
+        response = await self.llm_client.agenerate_response(messages, max_tokens=self.max_tokens)
+        base_function = self._extract_code_block(response)
         print("\n=== Initial Function ===")
         print(base_function)
 
         self._add_message(messages, "assistant", f"```python\n{base_function}\n```")
 
-        # Step 2 - Add documentation
-        self._add_message(messages, "user", "Add a comprehensive documentation to this function, including "
-                                            "description, parameters, return value, examples, and edge cases. "
-                                            "Output the function in a ```python code block```.")
-        documented_function = self._extract_code_block(self.llm_client.generate_response(messages))
+        # Step 2 and 3 only depend on the base function, so request them concurrently
+        doc_messages = list(messages)
+        self._add_message(doc_messages, "user", "Add a comprehensive documentation to this function, including "
+                                                "description, parameters, return value, examples, and edge cases. "
+                                                "Output the function in a ```python code block```.")
+        test_messages = list(messages)
+        self._add_message(test_messages, "user", "Add unittest test cases for this function, including tests for "
+                                                 "basic functionality, edge cases, error cases and various input "
+                                                 "scenarios. Output the code in a ```python code block```.")
+        doc_response, test_response = await asyncio.gather(
+            self.llm_client.agenerate_response(doc_messages, max_tokens=self.max_tokens),
+            self.llm_client.agenerate_response(test_messages, max_tokens=self.max_tokens),
+        )
+
+        documented_function = self._extract_code_block(doc_response)
         print("\n=== Documented Function ===")
         print(documented_function)
 
-        self._add_message(messages, "assistant", f"```python\n{documented_function}\n```")
-
-        # Step 3 - Generate test cases
-        self._add_message(messages, "user", "Add unittest test cases for this function, including tests for basic "
-                                            "functionality, edge cases, error cases and various input scenarios. "
-                                            "Output the code in a ```python code block```.")
-        test_cases = self._extract_code_block(self.llm_client.generate_response(messages))
+        test_cases = self._extract_code_block(test_response)
         print("\n=== Test Cases ===")
         print(test_cases)
 
@@ -73,4 +90,4 @@ class QuasiAgent:
 if __name__ == "__main__":
     llm = LLMClient()
     agent = QuasiAgent(llm)
-    agent.develop_custom_function()
+    asyncio.run(agent.develop_custom_function())